@@ -5,8 +5,7 @@ Functions to sort the electrode position are also included.
 """
 
 import numpy as np
-import copy
-import itertools
+import pandas as pd
 
 OTBelectrodes_tuple = (
     "GR04MM1305",
@@ -133,6 +132,185 @@ matrix in DELSYSelectrodes_tuple.
 """
 
 
+# ---------------------------------------------------------------------
+# Built-in sorting orders of the matrices.
+#
+# MUST REMEMBER: python loops from 0 and the emg channels start from 0 but
+# the channel order reflects the real channels and starts from 1! This order
+# is for the user, while the script uses the base0 sorting order.
+#
+# Each sorting order is stored flattened by matrix column, -1 indicates the
+# position of the empty (np.nan) channel. The number of rows and columns of
+# each matrix is stored in _SHAPES.
+
+
+def _frozen_order(base0_sorting_order):
+    """
+    Flatten a built-in sorting order in a read-only np.int64 array.
+    """
+
+    order = np.array(base0_sorting_order, dtype=np.int64).ravel()
+    order.setflags(write=False)
+
+    return order
+
+
+# Channel Order GR08MM1305 and GR04MM1305, orientation 0
+#        0   1   2   3   4
+# 0     64  39  38  13  12
+# 1     63  40  37  14  11
+# 2     62  41  36  15  10
+# 3     61  42  35  16   9
+# 4     60  43  34  17   8
+# 5     59  44  33  18   7
+# 6     58  45  32  19   6
+# 7     57  46  31  20   5
+# 8     56  47  30  21   4
+# 9     55  48  29  22   3
+# 10    54  49  28  23   2
+# 11    53  50  27  24   1
+# 12    52  51  26  25 NaN
+_GR08MM1305_0 = _frozen_order([
+    [63, 62, 61, 60, 59, 58, 57, 56, 55, 54, 53, 52, 51],
+    [38, 39, 40, 41, 42, 43, 44, 45, 46, 47, 48, 49, 50],
+    [37, 36, 35, 34, 33, 32, 31, 30, 29, 28, 27, 26, 25],
+    [12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 23, 24],
+    [11, 10,  9,  8,  7,  6,  5,  4,  3,  2,  1,  0, -1],
+])
+
+# Channel Order GR08MM1305 and GR04MM1305, orientation 180
+#        0   1   2   3   4
+# 0    NaN  25  26  51  52
+# 1      1  24  27  50  53
+# 2      2  23  28  49  54
+# 3      3  22  29  48  55
+# 4      4  21  30  47  56
+# 5      5  20  31  46  57
+# 6      6  19  32  45  58
+# 7      7  18  33  44  59
+# 8      8  17  34  43  60
+# 9      9  16  35  42  61
+# 10    10  15  36  41  62
+# 11    11  14  37  40  63
+# 12    12  13  38  39  64
+_GR08MM1305_180 = _frozen_order([
+    [-1,  0,  1,  2,  3,  4,  5,  6,  7,  8,  9, 10, 11],
+    [24, 23, 22, 21, 20, 19, 18, 17, 16, 15, 14, 13, 12],
+    [25, 26, 27, 28, 29, 30, 31, 32, 33, 34, 35, 36, 37],
+    [50, 49, 48, 47, 46, 45, 44, 43, 42, 41, 40, 39, 38],
+    [51, 52, 53, 54, 55, 56, 57, 58, 59, 60, 61, 62, 63],
+])
+
+# Channel Order GR10MM0808, orientation 0
+#     0   1   2   3   4   5   6   7
+# 0  57  49  41  33  25  17   9   1
+# 1  58  50  42  34  26  18  10   2
+# 2  59  51  43  35  27  19  11   3
+# 3  60  52  44  36  28  20  12   4
+# 4  61  53  45  37  29  21  13   5
+# 5  62  54  46  38  30  22  14   6
+# 6  63  55  47  39  31  23  15   7
+# 7  64  56  48  40  32  24  16   8
+_GR10MM0808_0 = _frozen_order([
+    [56, 57, 58, 59, 60, 61, 62, 63],
+    [48, 49, 50, 51, 52, 53, 54, 55],
+    [40, 41, 42, 43, 44, 45, 46, 47],
+    [32, 33, 34, 35, 36, 37, 38, 39],
+    [24, 25, 26, 27, 28, 29, 30, 31],
+    [16, 17, 18, 19, 20, 21, 22, 23],
+    [8,  9, 10, 11, 12, 13, 14, 15],
+    [0,  1,  2,  3,  4,  5,  6,  7],
+])
+
+# Channel Order GR10MM0808, orientation 180
+#     0   1   2   3   4   5   6   7
+# 0   8  16  24  32  40  48  56  64
+# 1   7  15  23  31  39  47  55  63
+# 2   6  14  22  30  38  46  54  62
+# 3   5  13  21  29  37  45  53  61
+# 4   4  12  20  28  36  44  52  60
+# 5   3  11  19  27  35  43  51  59
+# 6   2  10  18  26  34  42  50  58
+# 7   1   9  17  25  33  41  49  57
+_GR10MM0808_180 = _frozen_order([
+    [7,   6,  5,  4,  3,  2,  1,  0],
+    [15, 14, 13, 12, 11, 10,  9,  8],
+    [23, 22, 21, 20, 19, 18, 17, 16],
+    [31, 30, 29, 28, 27, 26, 25, 24],
+    [39, 38, 37, 36, 35, 34, 33, 32],
+    [47, 46, 45, 44, 43, 42, 41, 40],
+    [55, 54, 53, 52, 51, 50, 49, 48],
+    [63, 62, 61, 60, 59, 58, 57, 56],
+])
+
+# Channel Order Trigno Galileo Sensor
+#
+#     1
+# 4       2
+#     3
+#
+# Will be represented as:
+#     0
+# 0   1
+# 1   2
+# 2   3
+# 3   4
+_TRIGNO_GALILEO = _frozen_order([[0, 1, 2, 3]])
+
+_SORT_ORDERS = {
+    ("GR08MM1305", 0): _GR08MM1305_0,
+    ("GR08MM1305", 180): _GR08MM1305_180,
+    ("GR04MM1305", 0): _GR08MM1305_0,
+    ("GR04MM1305", 180): _GR08MM1305_180,
+    ("GR10MM0808", 0): _GR10MM0808_0,
+    ("GR10MM0808", 180): _GR10MM0808_180,
+    ("Trigno Galileo Sensor", None): _TRIGNO_GALILEO,
+}
+
+# Number of rows and columns of each matrix.
+_SHAPES = {
+    "GR08MM1305": (13, 5),
+    "GR04MM1305": (13, 5),
+    "GR10MM0808": (8, 8),
+    "Trigno Galileo Sensor": (4, 1),
+}
+
+
+def _check_sort_orders():
+    """
+    Check that every built-in sorting order matches the matrix shape and
+    contains each channel once.
+    """
+
+    n_electrodes = {
+        **OTBelectrodes_Nelectrodes, **DELSYSelectrodes_Nelectrodes,
+    }
+
+    for (code, orientation), order in _SORT_ORDERS.items():
+        n_rows, n_cols = _SHAPES[code]
+        if order.size != n_rows * n_cols:
+            raise ValueError(
+                f"The {code} sorting order (orientation {orientation}) " +
+                "does not match the matrix shape"
+            )
+
+        if np.count_nonzero(order < 0) != order.size - n_electrodes[code]:
+            raise ValueError(
+                f"Wrong number of empty channels in the {code} sorting " +
+                f"order (orientation {orientation})"
+            )
+
+        channels = np.sort(order[order >= 0])
+        if not np.array_equal(channels, np.arange(n_electrodes[code])):
+            raise ValueError(
+                f"Duplicated or missing channels in the {code} sorting " +
+                f"order (orientation {orientation})"
+            )
+
+
+_check_sort_orders()
+
+
 # ---------------------------------------------------------------------
 # Sort the electrodes of different matrices.
 
@@ -145,6 +323,7 @@ def sort_rawemg(
     n_rows=None,
     n_cols=None,
     custom_sorting_order=None,
+    return_ndarray=False,
 ):
     """
     Sort RAW_SIGNAL based on matrix type and orientation.
@@ -205,8 +384,13 @@ def sort_rawemg(
         Specifically, the number of columns are defined by
         len(custom_sorting_order) while the number of rows by
         len(custom_sorting_order[0]). np.nan can be used to specify empty
-        channels. Please refer to the Notes and Examples section for the
-        structure of the custom sorting order.
+        channels. The lists can have different lengths only if
+        dividebycolumn is False. Please refer to the Notes and Examples
+        section for the structure of the custom sorting order.
+    return_ndarray : bool, default False
+        Whether to return the sorted channels as np.ndarray instead of
+        pd.DataFrame. This is faster when the channels are not needed as
+        pd.DataFrame (e.g., for numerical processing).
 
     Returns
     -------
@@ -217,6 +401,10 @@ def sort_rawemg(
         If dividebycolumn == False a pd.DataFrame containing the sorted
         electrodes is returned. The matrix channels are stored in the
         pd.DataFrame columns.
+        If return_ndarray == True, np.ndarray are returned in place of
+        pd.DataFrame. When dividebycolumn == True, the np.ndarray of each
+        column are views of a single array containing all the sorted
+        channels.
 
     Notes
     -----
@@ -337,173 +525,65 @@ def sort_rawemg(
         "Custom order",
     ]
     if code not in valid_codes:
-        return ValueError("Unsupported code in sort_rawemg()")
+        raise ValueError("Unsupported code in sort_rawemg()")
+    if code not in ["Trigno Galileo Sensor", "None", "Custom order"]:
+        if (code, orientation) not in _SORT_ORDERS:
+            raise ValueError("Unsupported orientation in sort_rawemg()")
 
-    # Work on a copy of the RAW_SIGNAL
-    rawemg = copy.deepcopy(emgfile["RAW_SIGNAL"])
+    # The RAW_SIGNAL is never modified in place, the sorted channels are
+    # gathered in a new array.
+    rawemg = emgfile["RAW_SIGNAL"]
 
     # Get sorting order by matrix code
     if code == "Custom order":
-        # Theck that custom_sorting_order has been specified
+        # Check that custom_sorting_order has been specified
         if not isinstance(custom_sorting_order, list):
             raise ValueError(
                 "In sort_rawemg(), custom_sorting_order must be a list of " +
                 "lists when code=='Custom order'"
             )
 
-        # Get custom sorting order
-        base0_sorting_order = custom_sorting_order
-
-    elif code in ["GR08MM1305", "GR04MM1305"]:
-        # Get sorting order by matrix orientation
-        if orientation == 0:
-            """
-            MUST REMEMBER: python loops from 0 and the emg channels start
-            from 0 but the channel order reflects the real channels and
-            starts from 1! This order is for the user, while the script
-            uses the base0_sorting_order.
-
-            base0_sorting_order provides the sorting order while
-            base0_nanpos indicates the position of the empty (np.nan)
-            channel.
-
-            Channel Order GR08MM1305
-                   0   1   2   3   4
-            0     64  39  38  13  12
-            1     63  40  37  14  11
-            2     62  41  36  15  10
-            3     61  42  35  16   9
-            4     60  43  34  17   8
-            5     59  44  33  18   7
-            6     58  45  32  19   6
-            7     57  46  31  20   5
-            8     56  47  30  21   4
-            9     55  48  29  22   3
-            10    54  49  28  23   2
-            11    53  50  27  24   1
-            12    52  51  26  25 NaN
-            """
-            base0_sorting_order = [
-                [63, 62, 61, 60, 59, 58, 57, 56, 55, 54, 53, 52,     51],
-                [38, 39, 40, 41, 42, 43, 44, 45, 46, 47, 48, 49,     50],
-                [37, 36, 35, 34, 33, 32, 31, 30, 29, 28, 27, 26,     25],
-                [12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 23,     24],
-                [11, 10,  9,  8,  7,  6,  5,  4,  3,  2,  1,  0, np.nan],
-            ]
-
-        elif orientation == 180:
-            """
-            Channel Order GR08MM1305
-                   0   1   2   3   4
-            0    NaN  25  26  51  52
-            1      1  24  27  50  53
-            2      2  23  28  49  54
-            3      3  22  29  48  55
-            4      4  21  30  47  56
-            5      5  20  31  46  57
-            6      6  19  32  45  58
-            7      7  18  33  44  59
-            8      8  17  34  43  60
-            9      9  16  35  42  61
-            10    10  15  36  41  62
-            11    11  14  37  40  63
-            12    12  13  38  39  64
-            """
-            base0_sorting_order = [
-                [np.nan,  0,  1,  2,  3,  4,  5,  6,  7,  8,  9, 10, 11],
-                [24,     23, 22, 21, 20, 19, 18, 17, 16, 15, 14, 13, 12],
-                [25,     26, 27, 28, 29, 30, 31, 32, 33, 34, 35, 36, 37],
-                [50,     49, 48, 47, 46, 45, 44, 43, 42, 41, 40, 39, 38],
-                [51,     52, 53, 54, 55, 56, 57, 58, 59, 60, 61, 62, 63],
-            ]
-
-    elif code == "GR10MM0808":
-        if orientation == 0:
-            """
-            Channel Order GR10MM0808
-                0   1   2   3   4   5   6   7
-            0  57  49  41  33  25  17   9   1
-            1  58  50  42  34  26  18  10   2
-            2  59  51  43  35  27  19  11   3
-            3  60  52  44  36  28  20  12   4
-            4  61  53  45  37  29  21  13   5
-            5  62  54  46  38  30  22  14   6
-            6  63  55  47  39  31  23  15   7
-            7  64  56  48  40  32  24  16   8
-            """
-            base0_sorting_order = [
-                [56, 57, 58, 59, 60, 61, 62, 63],
-                [48, 49, 50, 51, 52, 53, 54, 55],
-                [40, 41, 42, 43, 44, 45, 46, 47],
-                [33, 33, 34, 35, 36, 37, 38, 39],
-                [24, 25, 26, 27, 28, 29, 30, 31],
-                [16, 17, 18, 19, 20, 21, 22, 23],
-                [8,  9, 10, 11, 12, 13, 14, 15],
-                [0,  1,  2,  3,  4,  5,  6,  7],
-            ]
-
-        elif orientation == 180:
-            """
-            Channel Order GR10MM0808
-                0   1   2   3   4   5   6   7
-            0   8  16  24  32  40  48  56  64
-            1   7  16  23  31  39  47  55  63
-            2   6  14  22  30  38  46  54  62
-            3   5  13  21  29  37  45  53  61
-            4   4  12  20  28  36  44  52  60
-            5   3  11  19  27  35  43  51  59
-            6   2  10  18  26  34  42  50  58
-            7   1   9  17  25  33  41  49  57
-            """
-            base0_sorting_order = [
-                [7,   6,  5,  4,  3,  2,  1,  0],
-                [15, 14, 13, 12, 11, 10,  9,  8],
-                [23, 22, 21, 20, 19, 18, 17, 16],
-                [31, 30, 29, 28, 27, 26, 25, 24],
-                [39, 38, 37, 36, 35, 34, 33, 32],
-                [47, 46, 45, 44, 43, 42, 41, 40],
-                [55, 54, 53, 52, 51, 50, 49, 48],
-                [63, 62, 61, 60, 59, 58, 57, 56],
-            ]
+        # Get custom sorting order, every list is a matrix column. Empty
+        # channels (np.nan) are marked with -1, as in the built-in sorting
+        # orders. The columns are flattened one by one, so that they can
+        # have different lengths if the RAW_SIGNAL is not divided by column.
+        try:
+            flattened_base0_sorting_order = np.concatenate(
+                [np.asarray(col, dtype=float).ravel()
+                 for col in custom_sorting_order]
+            )
+        except (ValueError, TypeError):
+            raise ValueError(
+                "In sort_rawemg(), custom_sorting_order must be a list of " +
+                "lists of channels"
+            )
+        flattened_base0_sorting_order = np.nan_to_num(
+            flattened_base0_sorting_order, nan=-1,
+        ).astype(np.int64)
+        custom_n_cols = len(custom_sorting_order)
+        custom_n_rows = len(custom_sorting_order[0])
 
     elif code == "Trigno Galileo Sensor":
-        """
-        Channel Order Trigno Galileo Sensor
+        # The orientation is ignored
+        flattened_base0_sorting_order = _SORT_ORDERS[(code, None)]
 
-            1
-        4       2
-            3
-
-        Will be represented as:
-            0
-        0   1
-        1   2
-        2   3
-        3   4
-        """
-        base0_sorting_order = [[0, 1, 2, 3]]
-
-    else:  # elif code == "None":
-        pass
+    elif code != "None":
+        # Get sorting order by matrix orientation
+        flattened_base0_sorting_order = _SORT_ORDERS[(code, orientation)]
 
-    # Once the order to sort channels has been retrieved,
-    # Sort the channels based on pre-specified order and reset columns
+    # Get the matrix shape if we need the sorted RAW_SIGNAL divided by
+    # column, and check it before sorting.
     if code not in [None, "None"]:
-        flattened_base0_sorting_order = list(
-            itertools.chain(*base0_sorting_order),
-        )
-        sorted_rawemg = rawemg.reindex(columns=flattened_base0_sorting_order)
-        sorted_rawemg.columns = range(sorted_rawemg.columns.size)
+        n_channels = flattened_base0_sorting_order.size
     else:
-        # Always allow a way to avoid electrodes sorting.
-        # Return a copy of the RAW_SIGNAL
-        sorted_rawemg = rawemg
+        n_channels = rawemg.shape[1]
 
-    # Check if we need the sorted RAW_SIGNAL divided by column
     if dividebycolumn:
-        if code not in [None, "None"]:
-            n_cols = len(base0_sorting_order)
-            n_rows = len(base0_sorting_order[0])
+        if code == "Custom order":
+            n_rows, n_cols = custom_n_rows, custom_n_cols
+
+        elif code not in [None, "None"]:
+            n_rows, n_cols = _SHAPES[code]
 
         else:
             # Check if n_rows and n_cols have been passed
@@ -518,18 +598,65 @@ def sort_rawemg(
                     "when code == 'None'"
                 )
 
-        # Create the empty dict to fill with the sorted_rawemg divided by
-        # columns. But first check for missing empty channel.
-        if n_rows * n_cols != sorted_rawemg.shape[1]:
+        # Check for missing empty channel.
+        if n_rows * n_cols != n_channels:
             raise ValueError(
                 "Number of rows * columns must match the number of channels."
             )
 
-        empty_dict = {f"col{n}": None for n in range(n_cols)}
+    # Once the order to sort channels has been retrieved,
+    # Sort the channels based on pre-specified order with a single gather.
+    if code not in [None, "None"]:
+        values = rawemg.to_numpy(copy=False)
+        if values.dtype.kind != "f":
+            values = values.astype(np.float64)
+
+        # Channels not available in the RAW_SIGNAL are considered empty.
+        # Empty channels are gathered from channel 0 and then set to np.nan,
+        # this avoids to copy the RAW_SIGNAL with an additional empty channel.
+        nan_mask = (
+            (flattened_base0_sorting_order < 0) |
+            (flattened_base0_sorting_order >= values.shape[1])
+        )
+        # Channels are gathered on the transposed array, where every channel
+        # is contiguous in memory (pandas stores the data by channel).
+        indexer = np.where(nan_mask, 0, flattened_base0_sorting_order)
+        gathered = np.take(values.T, indexer, axis=0).T
+        gathered[:, nan_mask] = np.nan
+        labels = pd.RangeIndex(n_channels)
+    else:
+        # Always allow a way to avoid electrodes sorting.
+        # Return a copy of the RAW_SIGNAL.
+        gathered = rawemg.to_numpy(copy=True)
+        labels = rawemg.columns
 
-        for pos, col in enumerate(empty_dict.keys()):
-            empty_dict[col] = sorted_rawemg.iloc[:, n_rows*pos:n_rows*(pos+1)]
+    # Divide the sorted RAW_SIGNAL by column
+    if dividebycolumn:
+        # Split the channels by matrix column with a single reshape.
+        # The channels are contiguous in gathered.T, so that every column is
+        # a view of the same array.
+        columns = gathered.T.reshape(n_cols, n_rows, -1)
+
+        if return_ndarray:
+            sorted_rawemg = {
+                f"col{pos}": columns[pos].T for pos in range(n_cols)
+            }
+        else:
+            sorted_rawemg = {
+                f"col{pos}": pd.DataFrame(
+                    columns[pos].T,
+                    index=rawemg.index,
+                    columns=labels[n_rows*pos:n_rows*(pos+1)],
+                )
+                for pos in range(n_cols)
+            }
 
-        sorted_rawemg = empty_dict
+    else:
+        if return_ndarray:
+            sorted_rawemg = gathered
+        else:
+            sorted_rawemg = pd.DataFrame(
+                gathered, index=rawemg.index, columns=labels,
+            )
 
     return sorted_rawemg
@@ -3,13 +3,10 @@ This module contains all the mathematical functions that are necessary for the
 library.
 """
 
-import copy
 import pandas as pd
 import numpy as np
-import numpy.polynomial.polynomial as poly
 import math
 from scipy import signal
-from scipy.spatial.distance import cdist
 from scipy.fftpack import fft
 import sys
 import warnings
@@ -48,12 +45,10 @@ def min_max_scaling(data=None, series_or_df=None, col_by_col=False):
         The normalised data of the same type as the input.
     """
 
-    # Create a deepcopy of the original data
-    if data is not None:
-        data = copy.deepcopy(data)
-
-    elif series_or_df is not None:
-        data = copy.deepcopy(series_or_df)
+    # The scaling always returns a new object, so the original data is never
+    # modified and does not need to be copied.
+    if data is None and series_or_df is not None:
+        data = series_or_df
 
         # Warn for the use of deprecated parameters
         msg = (
@@ -70,11 +65,9 @@ def min_max_scaling(data=None, series_or_df=None, col_by_col=False):
 
     elif isinstance(data, pd.DataFrame):
         if col_by_col:
-            for col in data.columns:
-                data[col] = (
-                    (data[col] - data[col].min()) /
-                    (data[col].max() - data[col].min())
-                )
+            # Column-wise min and max, broadcasted over the columns
+            data_min = data.min()
+            data = (data - data_min) / (data.max() - data_min)
 
             return data
 
@@ -99,11 +92,8 @@ def min_max_scaling(data=None, series_or_df=None, col_by_col=False):
                 if dims:  # Only 1 column
                     data = (data - data.min()) / (data.max() - data.min())
                 else:  # Multiple columns
-                    for col in range(data.shape[1]):
-                        data[:, col] = (
-                            (data[:, col] - data[:, col].min()) /
-                            (data[:, col].max() - data[:, col].min())
-                        )
+                    data_min = data.min(axis=0)
+                    data = (data - data_min) / (data.max(axis=0) - data_min)
 
                 return data
 
@@ -167,11 +157,12 @@ def norm_xcorr(sig1, sig2, out="both"):
     a = sig1 / norm_a
     norm_b = np.linalg.norm(sig2)
     b = sig2 / norm_b
-    c = np.correlate(a, b, mode='full')
 
-    # `numpy.correlate` may perform slowly in large arrays (i.e. n = 1e5)
-    # because it does not use the FFT to compute the convolution; in that case,
-    # `scipy.signal.correlate` might be preferable. No need in our use case.
+    # `numpy.correlate` performs slowly in large arrays (i.e. n = 1e5)
+    # because it does not use the FFT to compute the correlation.
+    # `scipy.signal.correlate` gives the same result and automatically uses
+    # the FFT when it is faster.
+    c = signal.correlate(a, b, mode='full', method='auto')
 
     # Calculate xcc based on out
     if out == "max":
@@ -279,23 +270,45 @@ def norm_twod_xcorr(df1, df2, mode="full"):
     406 -0.000002 -2.473282e-07  6.006046e-07 ...  1.605406e-05  0.000007
     """
 
-    # Perform 2d xcorr
-    correlate2d = signal.correlate2d(in1=df1, in2=df2, mode=mode)
-
-    # There is no need to work with numpy.ndarrays as signal.correlate2d is
-    # already converting the pd.DataFrame into numpy.ndarray, and the rest of
-    # the code does not take much time to run.
+    # Work on np.ndarray to avoid the creation of intermediate pd.DataFrame.
+    # Single precision inputs (as the STA of float32 signals) are not upcast,
+    # so that the FFT works on half the data.
+    arr1, arr2 = np.asarray(df1), np.asarray(df2)
+    dtype = np.result_type(arr1.dtype, arr2.dtype, np.float32)
+    arr1 = np.ascontiguousarray(arr1, dtype=dtype)
+    arr2 = np.ascontiguousarray(arr2, dtype=dtype)
+
+    # Perform 2d xcorr. signal.correlate gives the same result of
+    # signal.correlate2d but uses the FFT, which is O(N log N) instead of the
+    # O(N^2) of the spatial correlation. For 2-dimensional STAs the FFT is
+    # always the fastest, so we skip the method selection of method="auto".
+    # The "same" output of signal.correlate2d is centered differently and is
+    # therefore cut from the "full" output.
+    if mode == "same":
+        correlate2d = signal.correlate(
+            in1=arr1, in2=arr2, mode="full", method="fft",
+        )
+        start_row, start_col = arr2.shape[0] // 2, arr2.shape[1] // 2
+        correlate2d = correlate2d[
+            start_row:start_row + arr1.shape[0],
+            start_col:start_col + arr1.shape[1],
+        ]
+    elif mode == "valid" and arr1.shape == arr2.shape:
+        # With inputs of the same shape, the only valid position is the one
+        # where they are fully overlapped.
+        correlate2d = np.array([[np.vdot(arr1, arr2)]])
+    else:
+        correlate2d = signal.correlate(
+            in1=arr1, in2=arr2, mode=mode, method="fft",
+        )
 
     # Normalise the result of 2d xcorr for the different energy levels
     # MATLAB equivalent:
     # acor_norm = xcorr(x,y)/sqrt(sum(abs(x).^2)*sum(abs(y).^2))
     # http://gaidi.ca/weblog/normalizing-a-cross-correlation-in-matlab
-    absx = df1.abs()
-    absy = df2.abs()
-    expx = absx**2
-    expy = absy**2
-    sumx = expx.sum().sum()
-    sumy = expy.sum().sum()
+    # For real signals, sum(abs(x).^2) is the dot product of x with itself.
+    sumx = np.vdot(arr1, arr1)
+    sumy = np.vdot(arr2, arr2)
     acor_norm = correlate2d / np.sqrt(sumx * sumy)
 
     normxcorr_df = pd.DataFrame(acor_norm)
@@ -356,35 +369,37 @@ def compute_sil(ipts, mupulses, ignore_negative_ipts=False):
 
     if ignore_negative_ipts:
         # Ignore negative values, this is particularly needed for negative
-        # unbalanced sources.
-        source = source * np.abs(source)
+        # unbalanced sources. source * np.abs(source) is calculated in the
+        # array of np.abs(source) to allocate a single new array (source can
+        # share memory with ipts and cannot be changed in place).
+        abs_source = np.abs(source)
+        source = np.multiply(source, abs_source, out=abs_source)
 
     peaks_idxs = mupulses - ipts.index[0]
 
-    # Create clusters
+    # Create the peak cluster. The noise cluster (all the other samples) is
+    # only needed for its centroid, so it is not extracted from source.
     peak_cluster = source[peaks_idxs]
-    noise_cluster = np.delete(source, peaks_idxs)
 
     # Create centroids for each cluster
     peak_centroid = np.mean(peak_cluster)
-    noise_centroid = np.mean(noise_cluster)
+    noise_centroid = (
+        (np.sum(source) - np.sum(peak_cluster))
+        / (source.shape[0] - peak_cluster.shape[0])
+    )
 
     # Calculate within-cluster sums of point-to-centroid distances using the
     # squared Euclidean distance metric. It is defined as the sum of the
     # squares of the differences between the corresponding elements of the two
-    # vectors.
-    intra_sums = cdist(
-        peak_cluster.reshape(-1, 1),
-        peak_centroid.reshape(-1, 1),
-        metric="sqeuclidean",
-    ).sum()
+    # vectors. With a single centroid, this is the dot product of the
+    # differences with themselves.
+    peak_cluster = peak_cluster.astype(np.float64, copy=False)
+    diff = peak_cluster - peak_centroid
+    intra_sums = float(diff @ diff)
 
     # Calculate between-cluster sums of point-to-centroid distances
-    inter_sums = cdist(
-        peak_cluster.reshape(-1, 1),
-        noise_centroid.reshape(-1, 1),
-        metric="sqeuclidean",
-    ).sum()
+    diff = peak_cluster - noise_centroid
+    inter_sums = float(diff @ diff)
 
     # Calculate silhouette coefficient
     sil = (inter_sums - intra_sums) / max(intra_sums, inter_sums)
@@ -527,18 +542,23 @@ def compute_pnr(
     if constrain_pulses[0] is True:
         # Estimate by mupulses
         start, stop = -int(constrain_pulses[1]), int(constrain_pulses[1])
-        extended_mupulses = np.concatenate(
-            [mupulses + t for t in range(start, stop+1)]
-        )
-
-        # Consider noise what outside the extenbded mupulses
-        noise_times = np.setdiff1d(
-            np.arange(mupulses[0], mupulses[-1]+1), extended_mupulses,
-        )
+        offsets = np.arange(start, stop+1)
+        extended_mupulses = (
+            mupulses[:, np.newaxis] + offsets[np.newaxis, :]
+        ).ravel()
+
+        # Consider noise what outside the extenbded mupulses, between the
+        # first and the last firing.
+        first, last = mupulses[0], mupulses[-1] + 1
+        noise_mask = np.ones(last - first, dtype=bool)
+        extended_mupulses = extended_mupulses[
+            (extended_mupulses >= first) & (extended_mupulses < last)
+        ]
+        noise_mask[extended_mupulses - first] = False
 
         # Create clusters
         peak_cluster = source[mupulses]
-        noise_cluster = source[noise_times]
+        noise_cluster = source[first:last][noise_mask]
         noise_cluster = noise_cluster[~np.isnan(noise_cluster)]
         noise_cluster = noise_cluster[noise_cluster >= 0]
 
@@ -598,7 +618,72 @@ def compute_pnr(
     return pnr
 
 
-def derivatives_beamforming(sig, row, teta):
+def _derivatives_beamforming_rows(sigfft, teta):
+    """
+    Calculate the derivatives of derivatives_beamforming for every row.
+
+    sigfft is the row-wise fft of the signal. The returned de1 and de2 are
+    arrays containing, for each row, the derivatives calculated using that
+    row as reference.
+    """
+
+    # Define some necessary variables
+    total_rows, total_columns = np.shape(sigfft)
+    m = total_rows - 1
+    half_of_the_columns = np.arange((round(total_columns/2))) + 1
+    rows = np.arange(total_rows, dtype=np.float64)[:, np.newaxis]
+
+    # Select the frequencies used to calculate the derivatives
+    sigfft = np.asarray(sigfft)[:, half_of_the_columns]
+    sigfft = sigfft.astype(np.complex128, copy=False)  # Specify dtype
+
+    # With row r as reference, the position of the signal j is j-r (negative
+    # and mirrored for j < r). The terms of the pairs of signals (i, u) with
+    # u > i depend on a_i * conj(a_u) * (position[i]-position[u])**k, with
+    # a_i the phase shifted fft of the signal i. The sum over the pairs can
+    # therefore be expanded in sums over the single signals (b0, b1, b2),
+    # avoiding to calculate the m*(m-1)/2 pairs. The same sums also give the
+    # terms of the single signals, so that the first and second derivatives
+    # are calculated in a single pass.
+    # The phase shift of the reference r cancels out in all the terms, so
+    # that b0, b1 and b2 of every reference are obtained from the sums t0,
+    # t1 and t2 of the signals shifted by their absolute position.
+    w = 2 * np.pi * half_of_the_columns / total_columns
+    c = sigfft * np.exp(1j * w * rows * teta)
+    t0 = np.sum(c, axis=0)
+    c_rows = c * rows
+    t1 = np.sum(c_rows, axis=0)
+    t2 = np.sum(c_rows * rows, axis=0)
+
+    b0 = t0 - c  # The reference is not part of the pairs
+    b1 = t1 - rows * t0
+    b2 = t2 - 2 * rows * t1 + rows**2 * t0
+    s_conj = np.conj(c)
+
+    # The terms only depend on the frequency through w. Calculate once the
+    # weight of each frequency, including the constant factors of the terms,
+    # and sum over the frequencies with a matrix-vector product.
+    w_de1 = -2 * w / m**2
+    w_de2 = 2 * w / m
+    w_de12 = -2 * w**2 / m**2
+    w_de22 = 2 * w**2 / m
+
+    # Calculate the first and second term of the first derivative
+    term_de1 = np.imag(b1 * np.conj(b0)) @ w_de1
+    term_de2 = np.imag(s_conj * b1) @ w_de2
+
+    # Calculate the first and second term of the second derivative
+    term_de12 = (np.real(b2 * np.conj(b0)) - np.abs(b1)**2) @ w_de12
+    term_de22 = np.real(s_conj * b2) @ w_de22
+
+    # Calculate the first and second derivative
+    de1 = 2 / total_columns * (term_de1 + term_de2)
+    de2 = 2 / total_columns * (term_de12 + term_de22)
+
+    return de1, de2
+
+
+def derivatives_beamforming(sig, row, teta, sigfft=None):
     """
     Calculate devivatives for the beamforming technique.
 
@@ -614,6 +699,10 @@ def derivatives_beamforming(sig, row, teta):
         The actual row in the iterative procedure.
     teta : float
         The value of teta.
+    sigfft : None or np.ndarray, default None
+        The FFT of sig, calculated row-wise. If None, it is calculated from
+        sig. Passing it avoids recalculating the FFT at each call when sig
+        does not change between the calls.
 
     Returns
     -------
@@ -628,102 +717,15 @@ def derivatives_beamforming(sig, row, teta):
         velocity.
     """
 
-    # Define some necessary variables
-    total_rows = np.shape(sig)[0]
-    m = total_rows - 1
-    total_columns = np.shape(sig)[1]
-    half_of_the_columns = np.arange((round(total_columns/2))) + 1
-
-    # Create a custom position index with negative and mirrored values for
-    # index < row.
-    position = np.zeros(np.shape(sig)[0])
-    position[0] = row + 1  # + 1 used to overcome base 0 here and following
-
-    for i in range(1, row+1):
-        position[i] = i-(row+1)
-
-    for i in range(m-row):
-        position[i+row+1] = i + 1
-
-    position = np.delete(position, 0)
-
-    # Shift sig and move the value contained in sig[row] to sig[0]
-    this_row = sig[row, :]
-    sig = np.delete(sig, (row), axis=0)  # axis=0 to delete rows
-    sig = np.insert(sig, 0, this_row, axis=0)
-
     # Calculate fft row-wise (for each signal)
-    sigfft = np.zeros_like(sig, dtype=np.complex128)  # Specify dtype as complex
-    for i in range(total_rows):
-        sigfft[i, :] = fft(sig[i, :])
-
-    # Create the series used to store the terms of the derivatives
-    term_de1 = np.zeros(np.shape(half_of_the_columns)[0])
-    term_de2 = np.zeros(np.shape(half_of_the_columns)[0])
-    term_de12 = np.zeros(np.shape(half_of_the_columns)[0])
-    term_de22 = np.zeros(np.shape(half_of_the_columns)[0])
-
-    # Calculate the first term of the first derivative
-    for i in range(m):
-        for u in range(i+1, m):
-
-            s_fft = sigfft[i+1, half_of_the_columns]
-            s_conj = np.conj(sigfft[u+1, half_of_the_columns])
-            s_exp = np.exp(1j * 2 * np.pi * half_of_the_columns * (position[i]-position[u]) * teta / total_columns)
-            s_last = 2 * np.pi * half_of_the_columns * (position[i]-position[u]) / total_columns
-
-            image = np.imag(s_fft * s_conj * s_exp * s_last)
-
-            term_de1 = term_de1-image
-
-    term_de1 = (term_de1*2) / (m**2)
-
-    # Calculate the second term of the first derivative
-    for i in range(m):
-
-        s_fft = sigfft[i+1, half_of_the_columns]
-        s_exp = np.exp(1j * 2 * np.pi * half_of_the_columns * position[i] * teta / total_columns)
-        s_last = 2 * np.pi * half_of_the_columns * position[i] / total_columns
-
-        term_de2 = term_de2 + (s_fft * s_exp * s_last)
-
-    s_conj = np.conj(sigfft[0, half_of_the_columns])
-
-    term_de2 = 2 * np.imag(s_conj * term_de2) / m
-
-    # Calculate the first derivative
-    de1 = 2 / total_columns * np.sum(term_de1 + term_de2)
-
-    # Calculate the first term of the second derivative
-    for i in range(m):
-        for u in range(i+1, m):
-
-            s_fft = sigfft[i+1, half_of_the_columns]
-            s_conj = np.conj(sigfft[u+1, half_of_the_columns])
-            s_exp = np.exp(1j * 2 * np.pi * half_of_the_columns * (position[i]-position[u]) * teta / total_columns)
-            s_last = 2 * np.pi * half_of_the_columns * (position[i]-position[u]) / total_columns
+    if sigfft is None:
+        sigfft = fft(sig, axis=1)
 
-            term_de12 = term_de12 - np.real(s_fft * s_conj * s_exp * (s_last**2))
+    # Calculate the derivatives with each row as reference and keep the
+    # requested one.
+    de1, de2 = _derivatives_beamforming_rows(sigfft=sigfft, teta=teta)
 
-    term_de12 = (term_de12 * 2) / (m ** 2)
-
-    # Calculate the second term of the second derivative
-    for i in range(m):
-
-        s_fft = sigfft[i+1, half_of_the_columns]
-        s_exp = np.exp(1j * 2 * np.pi * half_of_the_columns * position[i] * teta / total_columns)
-        s_last = 2 * np.pi * half_of_the_columns * position[i] / total_columns
-
-        term_de22 = term_de22 + (s_fft * s_exp * (s_last**2))
-
-    s_conj = np.conj(sigfft[0, half_of_the_columns])
-
-    term_de22 = 2 * np.real(s_conj * term_de22) / m
-
-    # Calculate the second derivative
-    de2 = 2 / total_columns * np.sum(term_de12 + term_de22)
-
-    return de1, de2
+    return de1[row], de2[row]
 
 
 def mle_cv_est(sig, initial_teta, ied, fsamp):
@@ -771,18 +773,19 @@ def mle_cv_est(sig, initial_teta, ied, fsamp):
     trial = 0
     eps = sys.float_info.epsilon
 
+    # The signal does not change between the iterations, calculate its fft
+    # only once.
+    sigfft = fft(sig, axis=1)
+    total_rows = np.shape(sig)[0]
+
     while abs(teta - t) >= 5e-5 and trial < 30:
         trial = trial + 1
         teta = t
-        # Initialize the first and second derivatives
-        de1 = 0
-        de2 = 0
-
-        # Calculate the first and second derivatives
-        for row in range(np.shape(sig)[0]):
-            de1t, de2t = derivatives_beamforming(sig=sig, row=row, teta=teta)
-            de1 = de1 + de1t + eps
-            de2 = de2 + de2t + eps
+        # Calculate the first and second derivatives, summing those obtained
+        # with each row as reference.
+        de1, de2 = _derivatives_beamforming_rows(sigfft=sigfft, teta=teta)
+        de1 = np.sum(de1) + total_rows * eps
+        de2 = np.sum(de2) + total_rows * eps
 
         # Newton's criteria
         if de2 > 0:
@@ -901,26 +904,30 @@ def find_mle_teta(sig1, sig2, ied, fsamp):
     if sig2.ndim != 1:
         raise ValueError("sig2 is not 1 dimesional")
 
+    # Calculate the sum of sig1[:len(sig1)-i] * sig2[i:] for each delay i
+    # from a single cross-correlation. The delay i is at index len(sig1)-1+i
+    # of the full cross-correlation, and delays longer than sig2 give 0.
     delay = np.arange(teta_min, teta_max+1)
+    xcorr = signal.correlate(sig2, sig1, mode="full", method="auto")
+    in_signal = (delay >= 0) & (delay < len(sig2))
     corrpos = np.zeros(len(delay))
-    for idx, i in enumerate(delay):
-        sig1_tosum = sig1[:len(sig1)-i]
-        sig2_tosum = sig2[i:]
-
-        corrpos[idx-teta_min+1] = np.sum(sig1_tosum * sig2_tosum)
+    corrpos[in_signal] = xcorr[len(sig1) - 1 + delay[in_signal]]
+    # Keep the values in the same position of corrpos as when they were
+    # calculated one at a time.
+    corrpos = np.roll(corrpos, 1 - teta_min)
 
     pos = corrpos.argmax() + 1
     # +1 is necessary to overcome base 0 and prevent teta from beeing 0
 
     if pos > 1 and pos < len(delay):
-        x = delay[pos-2: pos+1]
-        y = corrpos[pos-2: pos+1]
-
-        coefs = poly.polyfit(x=x, y=y, deg=2)
-        # The polyfit function originally returns flipped coefficients
-        coefs = np.flip(coefs)
+        # Vertex of the parabola passing through the 3 points around the
+        # peak. The delays are spaced by 1, so it is found in closed form
+        # as an offset from the central delay.
+        y_prev, y_peak, y_next = corrpos[pos-2: pos+1]
 
-        teta = -coefs[1] / (2 * coefs[0])
+        teta = delay[pos-1] + 0.5 * (y_prev - y_next) / (
+            y_prev - 2 * y_peak + y_next
+        )
 
     else:
         teta = pos
@@ -8,16 +8,15 @@ import sys
 from openhdemg.library.tools import delete_mus
 from openhdemg.library.mathtools import (
     norm_twod_xcorr,
-    norm_xcorr,
     find_mle_teta,
     mle_cv_est,
 )
 from openhdemg.library.electrodes import sort_rawemg
 from openhdemg.library.plotemg import plot_idr, plot_muaps, plot_muaps_for_cv
-from scipy import signal
+from scipy import signal, fft
 import matplotlib.pyplot as plt
-from functools import reduce
 import numpy as np
+import math
 import time
 from joblib import Parallel, delayed
 import copy
@@ -104,15 +103,18 @@ def diff(sorted_rawemg):
 
     # Loop matrix columns
     for col in sorted_rawemg.keys():
-        # Loop matrix rows
-        for pos, row in enumerate(sorted_rawemg[col].columns):
-            if pos > 0:
-                res = (
-                    sorted_rawemg[col].loc[:, row - 1] - sorted_rawemg[col].loc[:, row]
-                )
-                sd[col][row] = res
-
-        sd[col] = pd.DataFrame(sd[col])
+        # Subtract each row from the previous one, for all the rows at once.
+        # The result of row - 1 minus row is stored under the label of row.
+        # The dtype of the input (float32 for the RAW_SIGNAL) is preserved
+        # and the new array is wrapped without copying it.
+        this_col = sorted_rawemg[col]
+        values = this_col.to_numpy()
+        sd[col] = pd.DataFrame(
+            values[:, :-1] - values[:, 1:],
+            index=this_col.index,
+            columns=this_col.columns[1:],
+            copy=False,
+        )
 
     return sd
 
@@ -194,17 +196,22 @@ def double_diff(sorted_rawemg):
 
     # Loop matrix columns
     for col in sorted_rawemg.keys():
-        # Loop matrix rows
-        for pos, row in enumerate(sorted_rawemg[col].columns):
-            if pos > 1:
-                res = (
-                    -sorted_rawemg[col].loc[:, row - 2]
-                    + 2 * sorted_rawemg[col].loc[:, row - 1]
-                    - sorted_rawemg[col].loc[:, row]
-                )
-                dd[col][row] = res
-
-        dd[col] = pd.DataFrame(dd[col])
+        # Apply the [-1, 2, -1] kernel along the rows, for all the rows at
+        # once. The result centred on row - 1 is stored under the label of
+        # row.
+        # The kernel is applied in place on a single new array, which keeps
+        # the dtype of the input and is wrapped without copying it.
+        this_col = sorted_rawemg[col]
+        values = this_col.to_numpy()
+        this_dd = 2 * values[:, 1:-1]
+        this_dd -= values[:, :-2]
+        this_dd -= values[:, 2:]
+        dd[col] = pd.DataFrame(
+            this_dd,
+            index=this_col.index,
+            columns=this_col.columns[2:],
+            copy=False,
+        )
 
     return dd
 
@@ -254,16 +261,40 @@ def extract_delsys_muaps(emgfile):
 
     all_muaps = emgfile["EXTRAS"]
     muaps_dict = {mu: None for mu in range(emgfile["NUMBER_OF_MUS"])}
+
+    # Parse the MU of every column once, instead of filtering all the columns
+    # for every MU, and get the positions of the columns of each MU.
+    col_mus = all_muaps.columns.astype(str).str.extract(
+        r"MU_(\d+)_CH_", expand=False,
+    )
+    mu_positions = pd.RangeIndex(len(col_mus)).groupby(col_mus)
+
     for mu in range(emgfile["NUMBER_OF_MUS"]):
-        df = pd.DataFrame(all_muaps.filter(regex=f"MU_{mu}_CH_"))
+        df = all_muaps.take(mu_positions.get(str(mu), []), axis=1)
         df.columns = range(len(df.columns))
         muaps_dict[mu] = {"col0": df}
 
     return muaps_dict
 
 
+def _pulse_windows(thismups, halftime, n_samples):
+    """
+    Get the samples of the complete windows around the MU pulses.
+
+    Returns the boolean mask of the pulses whose window of +/- halftime
+    samples is entirely in the signal and the np.ndarray of shape
+    (n_valid_pulses, halftime * 2) with the samples of these windows.
+    """
+
+    thismups = np.asarray(thismups)
+    valid = (thismups >= halftime) & (thismups + halftime <= n_samples)
+    idx = thismups[valid, np.newaxis] + np.arange(-halftime, halftime)
+
+    return valid, idx
+
+
 def sta(
-    emgfile, sorted_rawemg, firings=[0, 50], timewindow=50
+    emgfile, sorted_rawemg, firings=[0, 50], timewindow=50, derivation="mono"
 ):
     """
     Computes the spike-triggered average (STA) of every MUs.
@@ -285,6 +316,22 @@ def sta(
             The STA is calculated over all the firings.
     timewindow : int, default 50
         Timewindow to compute STA in milliseconds.
+    derivation : str {"mono", "sd", "dd"}, default "mono"
+        Whether to compute the STA on sorted_rawemg, or on its single or
+        double differential derivation.
+
+        ``mono``
+            The STA is calculated on sorted_rawemg as it is.
+
+        ``sd``
+            The STA is calculated on the single differential derivation.
+            Same as passing ``diff(sorted_rawemg)``, but the differential
+            signal is never computed.
+
+        ``dd``
+            The STA is calculated on the double differential derivation.
+            Same as passing ``double_diff(sorted_rawemg)``, but the double
+            differential signal is never computed.
 
     Returns
     -------
@@ -303,6 +350,8 @@ def sta(
     -----
     The returned file is called ``sta_dict`` for convention.
 
+    The STA is calculated and returned in single precision (float32).
+
     Examples
     --------
     Calculate STA of all the MUs in the emgfile on the first 25 firings
@@ -345,12 +394,12 @@ def sta(
     ...     code="GR08MM1305",
     ...     orientation=180,
     ... )
-    >>> sd = emg.diff(sorted_rawemg=sorted_rawemg)
     >>> sta = emg.sta(
     ...     emgfile=emgfile,
-    ...     sorted_rawemg=sd,
+    ...     sorted_rawemg=sorted_rawemg,
     ...     firings="all",
     ...     timewindow=50,
+    ...     derivation="sd",
     ... )
     >>> sta[0]["col0"]
          1         2          3  ...         10         11         12
@@ -367,24 +416,43 @@ def sta(
     101 NaN -4.587545  -0.855417 ... -10.549041   9.802613 -15.820260
     """
 
+    if derivation not in ["mono", "sd", "dd"]:
+        raise ValueError(
+            "derivation can be one of 'mono', 'sd', 'dd'. " +
+            f"{derivation} was passed instead"
+        )
+
     # Compute half of the timewindow in samples
     timewindow_samples = round((timewindow / 1000) * emgfile["FSAMP"])
     halftime = round(timewindow_samples / 2)
-    tottime = halftime * 2
 
     # Container of the STA for every MUs
     # {0: {}, 1: {}, 2: {}, 3: {}}
     sta_dict = {mu: {} for mu in range(emgfile["NUMBER_OF_MUS"])}
 
-    # Calculate STA on sorted_rawemg for every mu and put it into sta_dict[mu]
+    # Check if there are firings in every MU
     for mu in sta_dict.keys():
-        # Check if there are firings in this MU
-        tot_firings = len(emgfile["MUPULSES"][mu])
-        if tot_firings == 0:
+        if len(emgfile["MUPULSES"][mu]) == 0:
             raise ValueError(
                 "Empty MU in sta(). First use delete_empty_mus()."
             )
 
+    # Get the np.ndarray of each matrix column once, instead of once per MU.
+    # The STA is calculated in single precision, which is sufficient for EMG
+    # signals and halves the memory read by the gather. Signals that are
+    # already float32 (as the RAW_SIGNAL) are not copied.
+    emg_arrays = {
+        col: sorted_rawemg[col].to_numpy(dtype=np.float32)
+        for col in sorted_rawemg.keys()
+    }
+    # All the matrix columns contain the same samples
+    n_samples = min(emg_array.shape[0] for emg_array in emg_arrays.values())
+    n_rows_max = max(emg_array.shape[1] for emg_array in emg_arrays.values())
+
+    # STA function to run in parallel
+    def parallel(mu):
+        tot_firings = len(emgfile["MUPULSES"][mu])
+
         # Set firings if firings="all"
         if firings == "all":
             firings_ = [0, tot_firings]
@@ -394,21 +462,60 @@ def sta(
         # Get current mupulses
         thismups = emgfile["MUPULSES"][mu][firings_[0]: firings_[1]]
 
+        # Samples of the windows around all the pulses, shared by all the
+        # channels of the matrix. Incomplete muaps are avoided.
+        _, idx = _pulse_windows(thismups, halftime, n_samples)
+
+        # Buffer for the gathered samples, allocated once per MU and reused
+        # by all the matrix columns. It is not shared between MUs because
+        # they are processed in parallel threads.
+        buffer = np.empty((n_rows_max, *idx.shape), dtype=np.float32)
+
         # Calculate STA for each column in sorted_rawemg
         sorted_rawemg_sta = {}
-        for col in sorted_rawemg.keys():
-            row_dict = {}
-            for row in sorted_rawemg[col].columns:
-                emg_array = sorted_rawemg[col][row].to_numpy()
-                # Calculate STA using NumPy vectorized operations
-                sta_values = []
-                for pulse in thismups:
-                    ls = emg_array[pulse - halftime: pulse + halftime]
-                    # Avoid incomplete muaps
-                    if len(ls) == tottime:
-                        sta_values.append(ls)
-                row_dict[row] = np.mean(sta_values, axis=0)
-            sorted_rawemg_sta[col] = pd.DataFrame(row_dict)
+        for col, emg_array in emg_arrays.items():
+            # Calculate STA using NumPy vectorized operations. The samples of
+            # all the pulses and all the rows are gathered at once in an
+            # array of shape (n_rows, n_pulses, tottime). Gathering on the
+            # transposed array reads each row (stored column-major by
+            # sort_rawemg) with unit stride. The indices are always in the
+            # signal, so mode="clip" skips the bounds check and the
+            # temporary copy that np.take makes when out is passed.
+            sta_values = np.take(
+                emg_array.T, idx, axis=1, mode="clip",
+                out=buffer[:emg_array.shape[1]],
+            )
+            this_sta = np.mean(sta_values, axis=1).T
+            columns = sorted_rawemg[col].columns
+
+            # The average is linear, so the STA of the differential signal
+            # is the differential of the STA. Applying the derivation to the
+            # STA avoids computing it on the whole signal. As in diff and
+            # double_diff, the result is stored under the label of the
+            # following rows.
+            if derivation == "sd":
+                this_sta = this_sta[:, :-1] - this_sta[:, 1:]
+                columns = columns[1:]
+            elif derivation == "dd":
+                this_sta = (
+                    - this_sta[:, :-2]
+                    + 2 * this_sta[:, 1:-1]
+                    - this_sta[:, 2:]
+                )
+                columns = columns[2:]
+
+            sorted_rawemg_sta[col] = pd.DataFrame(this_sta, columns=columns)
+
+        return sorted_rawemg_sta
+
+    # Calculate STA on sorted_rawemg for every mu and put it into sta_dict[mu].
+    # The MUs are independent and NumPy releases the GIL while gathering and
+    # averaging, so they are processed in parallel threads, sharing
+    # sorted_rawemg without copying it.
+    res = Parallel(n_jobs=-1, prefer="threads")(
+        delayed(parallel)(mu) for mu in sta_dict.keys()
+    )
+    for mu, sorted_rawemg_sta in zip(sta_dict.keys(), res):
         sta_dict[mu] = sorted_rawemg_sta
 
     return sta_dict
@@ -449,6 +556,8 @@ def st_muap(emgfile, sorted_rawemg, timewindow=50):
     -----
     The returned file is called ``stmuap`` for convention.
 
+    The ST MUAPs are returned in single precision (float32).
+
     Examples
     --------
     Calculate the MUAPs of the differential signal.
@@ -482,41 +591,66 @@ def st_muap(emgfile, sorted_rawemg, timewindow=50):
     # Compute half of the timewindow in samples
     timewindow_samples = round((timewindow / 1000) * emgfile["FSAMP"])
     halftime = round(timewindow_samples / 2)
-    tottime = halftime * 2
 
     # Container of the ST for every MUs
     # {0: {}, 1: {}, 2: {}, 3: {} ...}
     sta_dict = {mu: {} for mu in range(emgfile["NUMBER_OF_MUS"])}
 
-    # Calculate ST on sorted_rawemg for every mu and put it into sta_dict[mu]
+    # Get the np.ndarray of each matrix column once, instead of once per MU
+    # and row. As in sta, the ST MUAPs are stored in single precision.
+    emg_arrays = {
+        col: sorted_rawemg[col].to_numpy(dtype=np.float32)
+        for col in sorted_rawemg.keys()
+    }
+    # All the matrix columns contain the same samples
+    n_samples = min(emg_array.shape[0] for emg_array in emg_arrays.values())
+    samples_index = pd.RangeIndex(halftime * 2)
+
+    # Check if there are firings in every MU
     for mu in sta_dict.keys():
-        # Check if there are firings in this MU
-        tot_firings = len(emgfile["MUPULSES"][mu])
-        if tot_firings == 0:
+        if len(emgfile["MUPULSES"][mu]) == 0:
             raise ValueError(
                 "Empty MU in sta(). First use delete_empty_mus()."
             )
 
+    # ST function to run in parallel
+    def parallel(mu):
         # Container for the st of each MUs' matrix column.
         sta_dict_cols = {}
-        # Get MUPULSES for this MU
-        thismups = emgfile["MUPULSES"][mu]
+        # Samples of the windows around all the pulses of this MU, shared by
+        # all the channels of the matrix. Incomplete muaps are avoided.
+        valid, idx = _pulse_windows(
+            emgfile["MUPULSES"][mu], halftime, n_samples,
+        )
+        # The ST MUAPs are labelled with the position of their pulse in the
+        # MUPULSES. The index and columns are immutable and shared by the
+        # pd.DataFrame of all the channels, so that they are created only
+        # once per MU.
+        valid_positions = pd.Index(np.flatnonzero(valid))
         # Calculate ST for each channel in each column in sorted_rawemg
-        for col in sorted_rawemg.keys():
+        for col, emg_array in emg_arrays.items():
+            # Gather the samples of all the pulses and all the rows at once in
+            # an array of shape (n_rows, n_pulses, tottime), as in sta.
+            windows = emg_array.T[:, idx]
             # Container for the st of each channel (row) in that matrix column.
             sta_dict_crows = {}
-            for row in sorted_rawemg[col].columns:
-                this_emgsig = sorted_rawemg[col][row].to_numpy()
-                # Container for the pd.DataFrame with MUAPs of each channel.
-                crow_muaps = {}
-                # Calculate ST using NumPy vectorized operations
-                for pos, pulse in enumerate(thismups):
-                    muap = this_emgsig[pulse - halftime: pulse + halftime]
-                    # Avoid incomplete muaps
-                    if len(muap) == tottime:
-                        crow_muaps[pos] = muap
-                sta_dict_crows[row] = pd.DataFrame(crow_muaps)
+            for pos_row, row in enumerate(sorted_rawemg[col].columns):
+                sta_dict_crows[row] = pd.DataFrame(
+                    windows[pos_row].T,
+                    index=samples_index,
+                    columns=valid_positions,
+                )
             sta_dict_cols[col] = sta_dict_crows
+
+        return sta_dict_cols
+
+    # Calculate ST on sorted_rawemg for every mu and put it into sta_dict[mu].
+    # As in sta, the MUs are processed in parallel threads, sharing
+    # sorted_rawemg without copying it.
+    res = Parallel(n_jobs=-1, prefer="threads")(
+        delayed(parallel)(mu) for mu in sta_dict.keys()
+    )
+    for mu, sta_dict_cols in zip(sta_dict.keys(), res):
         sta_dict[mu] = sta_dict_cols
 
     return sta_dict
@@ -551,12 +685,9 @@ def unpack_sta(sta_mu):
     # extract all the pd.DataFrames in a list
     dfs = [sta_mu[key] for key in keys]
 
-    # Merge in a single pd.DataFrame
-    df1 = reduce(
-        lambda left,
-        right: pd.merge(left, right, left_index=True, right_index=True),
-        dfs,
-    )
+    # Concatenate in a single pd.DataFrame. The matrix columns share the same
+    # index, so there is no need to merge them on it.
+    df1 = pd.concat(dfs, axis=1)
 
     return df1, list(keys)
 
@@ -588,9 +719,17 @@ def pack_sta(df_sta, keys):
     # Detect the number of columns per pd.DataFrame (matrix columns)
     slice = int(np.ceil(len(df_sta.columns) / len(keys)))
 
-    # Pack the sta accordingly
+    # Pack the sta accordingly. The matrix columns are built as views of the
+    # underlying np.ndarray, which avoids the indexing overhead of iloc.
+    values = df_sta.to_numpy()
     packed_sta = {
-        k: df_sta.iloc[:, slice*p:slice*(p+1)] for p, k in enumerate(keys)
+        k: pd.DataFrame(
+            values[:, slice*p:slice*(p+1)],
+            index=df_sta.index,
+            columns=df_sta.columns[slice*p:slice*(p+1)],
+            copy=False,
+        )
+        for p, k in enumerate(keys)
     }
 
     # packed_sta = {
@@ -604,6 +743,57 @@ def pack_sta(df_sta, keys):
     return packed_sta
 
 
+def _xcorr_alignment(sta1, sta2, finalduration, lag=None):
+    """
+    Get the rows of two STAs aligned by cross-correlation.
+
+    sta1 and sta2 are the unpacked STAs without empty channels. Returns the
+    slices of the rows of sta1 and sta2 that are aligned and last
+    finalduration. If the lag between the STAs is already known, it is not
+    computed again.
+    """
+
+    # Detect the time leads or lags from 2dxcorr
+    corr_lags = signal.correlation_lags(len(sta1), len(sta2), mode="same")
+    if lag is None:
+        # Compute 2dxcorr to identify a common lag/delay
+        normxcorr_df, _ = norm_twod_xcorr(sta1, sta2, mode="same")
+        # First signal compared to second
+        lag = np.median(
+            corr_lags[np.argmax(normxcorr_df.to_numpy(), axis=0)]
+        )
+
+    # Be sure that the lag/delay does not exceed values suitable for the final
+    # expected duration.
+    finalduration_samples = round(len(sta1) * finalduration)
+    if lag > (finalduration_samples / 2):
+        lag = finalduration_samples / 2
+
+    # Align the signals
+    dfmin = corr_lags.min()
+    dfmax = corr_lags.max()
+
+    start1 = dfmin + abs(lag) if lag > 0 else dfmin
+    stop1 = dfmax if lag > 0 else dfmax - abs(lag)
+
+    start2 = dfmin + abs(lag) if lag < 0 else dfmin
+    stop2 = dfmax if lag < 0 else dfmax - abs(lag)
+
+    # The lags are consecutive integers, convert the range of lags from start
+    # to stop (included) in the range of positions of the rows.
+    rows1 = range(math.ceil(start1 - dfmin), math.floor(stop1 - dfmin) + 1)
+    rows2 = range(math.ceil(start2 - dfmin), math.floor(stop2 - dfmin) + 1)
+
+    # Cut the signal to respect the final duration
+    tocutstart = round((len(rows1) - finalduration_samples) / 2)
+    tocutend = round(len(rows1) - tocutstart)
+
+    rows1 = rows1[tocutstart:tocutend]
+    rows2 = rows2[tocutstart:tocutend]
+
+    return slice(rows1.start, rows1.stop), slice(rows2.start, rows2.stop)
+
+
 def align_by_xcorr(sta_mu1, sta_mu2, finalduration=0.5):
     """
     Align the STA of 2 MUs by cross-correlation.
@@ -686,43 +876,10 @@ def align_by_xcorr(sta_mu1, sta_mu2, finalduration=0.5):
     df2, d_keys = unpack_sta(sta_mu2)
     no_nan_sta2 = df2.dropna(axis=1, inplace=False)
 
-    # Compute 2dxcorr to identify a common lag/delay
-    normxcorr_df, _ = norm_twod_xcorr(
-        no_nan_sta1, no_nan_sta2, mode="same"
-    )
-
-    # Detect the time leads or lags from 2dxcorr
-    corr_lags = signal.correlation_lags(
-        len(no_nan_sta1.index), len(no_nan_sta2.index), mode="same"
-    )
-    normxcorr_df = normxcorr_df.set_index(corr_lags)
-    lag = normxcorr_df.idxmax().median()  # First signal compared to second
-
-    # Be sure that the lag/delay does not exceed values suitable for the final
-    # expected duration.
-    finalduration_samples = round(len(df1.index) * finalduration)
-    if lag > (finalduration_samples / 2):
-        lag = finalduration_samples / 2
-
-    # Align the signals
-    dfmin = normxcorr_df.index.min()
-    dfmax = normxcorr_df.index.max()
-
-    start1 = dfmin + abs(lag) if lag > 0 else dfmin
-    stop1 = dfmax if lag > 0 else dfmax - abs(lag)
-
-    start2 = dfmin + abs(lag) if lag < 0 else dfmin
-    stop2 = dfmax if lag < 0 else dfmax - abs(lag)
-
-    df1cut = df1.set_index(corr_lags).loc[start1:stop1, :]
-    df2cut = df2.set_index(corr_lags).loc[start2:stop2, :]
-
-    # Cut the signal to respect the final duration
-    tocutstart = round((len(df1cut.index) - finalduration_samples) / 2)
-    tocutend = round(len(df1cut.index) - tocutstart)
-
-    df1cut = df1cut.iloc[tocutstart:tocutend, :]
-    df2cut = df2cut.iloc[tocutstart:tocutend, :]
+    # Align the STAs on the channels without empty values
+    rows1, rows2 = _xcorr_alignment(no_nan_sta1, no_nan_sta2, finalduration)
+    df1cut = df1.iloc[rows1, :]
+    df2cut = df2.iloc[rows2, :]
 
     # Reset index to have a common index
     df1cut.reset_index(drop=True, inplace=True)
@@ -846,8 +1003,8 @@ def tracking(
         If true, when the same MU has a match of XCC > threshold with
         multiple MUs, only the match with the highest XCC is returned.
     multiprocessing : bool, default True
-        If True (default) parallel processing will be used to reduce execution
-        time.
+        If True (default) parallel processing (in multiple threads) will be
+        used to reduce execution time.
     show : bool, default False
         Whether to plot the STA of pairs of MUs with XCC above threshold. Set
         to False (default) when gui=True to avoid postponing the GUI execution.
@@ -994,32 +1151,20 @@ def tracking(
             custom_sorting_order=custom_sorting_order,
         )
 
-        # Calculate the derivation if needed
-        if derivation == "mono":
-            pass
-        elif derivation == "sd":
-            emgfile1_sorted = diff(sorted_rawemg=emgfile1_sorted)
-            emgfile2_sorted = diff(sorted_rawemg=emgfile2_sorted)
-        elif derivation == "dd":
-            emgfile1_sorted = double_diff(sorted_rawemg=emgfile1_sorted)
-            emgfile2_sorted = double_diff(sorted_rawemg=emgfile2_sorted)
-        else:
-            raise ValueError(
-                f"derivation can be one of 'mono', 'sd', 'dd'. {derivation} was passed instead"
-                )
-
-        # Get the STAs
+        # Get the STAs, with the derivation if needed
         sta_emgfile1 = sta(
             emgfile1,
             emgfile1_sorted,
             firings=firings,
             timewindow=timewindow * 2,
+            derivation=derivation,
         )
         sta_emgfile2 = sta(
             emgfile2,
             emgfile2_sorted,
             firings=firings,
             timewindow=timewindow * 2,
+            derivation=derivation,
         )
 
     # Obtain custom MUAPs
@@ -1036,32 +1181,109 @@ def tracking(
 
     print("\nTracking started:")
 
+    # Unpack the STAs and remove the empty channels only once per MU, instead
+    # of once per comparison. As the STAs calculated by sta, custom MUAPs are
+    # cross-correlated in single precision, which is more than enough for
+    # the XCC and halves the data processed by the FFTs.
+    unpacked_sta1 = [
+        unpack_sta(sta_emgfile1[mu])[0].dropna(axis=1).to_numpy(
+            dtype=np.float32,
+        )
+        for mu in range(emgfile1["NUMBER_OF_MUS"])
+    ]
+    unpacked_sta2 = [
+        unpack_sta(sta_emgfile2[mu])[0].dropna(axis=1).to_numpy(
+            dtype=np.float32,
+        )
+        for mu in range(emgfile2["NUMBER_OF_MUS"])
+    ]
+
+    # The 2d cross-correlation is normalised by the energy of the aligned
+    # STAs. Store the cumulative energy of the rows of every MU, so that the
+    # energy of any range of rows is a single subtraction.
+    def cumulative_energy(arr):
+        row_energy = np.sum(np.square(arr, dtype=np.float64), axis=1)
+        return np.concatenate(([0], np.cumsum(row_energy)))
+
+    cum_energy1 = [cumulative_energy(arr) for arr in unpacked_sta1]
+    cum_energy2 = [cumulative_energy(arr) for arr in unpacked_sta2]
+
+    # When the STAs of all the MUs of each file have the same shape, the 2d
+    # xcorr used to align them is calculated in the frequency domain for all
+    # the MUs of file 2 at once. In this way, every STA is transformed only
+    # once instead of once per comparison.
+    batch_alignment = (
+        not isinstance(custom_muaps, list)
+        and len({arr.shape for arr in unpacked_sta1}) == 1
+        and len({arr.shape for arr in unpacked_sta2}) == 1
+    )
+    if batch_alignment:
+        n_rows1, n_cols1 = unpacked_sta1[0].shape
+        n_rows2, n_cols2 = unpacked_sta2[0].shape
+        fft_shape = [
+            fft.next_fast_len(n_rows1 + n_rows2 - 1, real=True),
+            fft.next_fast_len(n_cols1 + n_cols2 - 1, real=True),
+        ]
+        # The xcorr with sta2 is the convolution with sta2 reversed on both
+        # axes.
+        fft_sta1 = fft.rfftn(
+            np.stack(unpacked_sta1), s=fft_shape, axes=(1, 2),
+        )
+        fft_sta2 = fft.rfftn(
+            np.stack(unpacked_sta2)[:, ::-1, ::-1], s=fft_shape, axes=(1, 2),
+        )
+        # As in norm_twod_xcorr(mode="same")
+        start_row, start_col = n_rows2 // 2, n_cols2 // 2
+        corr_lags = signal.correlation_lags(n_rows1, n_rows2, mode="same")
+
     # Tracking function to run in parallel
     def parallel(mu_file1):  # Loop all the MUs of file 1
         # Dict to fill with the 2d cross-correlation results
         res = {"MU_file1": [], "MU_file2": [], "XCC": []}
 
+        # Get the lags between mu_file1 and all the MUs in file2 at once
+        lags = [None] * emgfile2["NUMBER_OF_MUS"]
+        if batch_alignment:
+            correlate2d = fft.irfftn(
+                fft_sta1[mu_file1] * fft_sta2, s=fft_shape, axes=(1, 2),
+            )[
+                :,
+                start_row:start_row + n_rows1,
+                start_col:start_col + n_cols1,
+            ]
+            lags = np.median(
+                corr_lags[np.argmax(correlate2d, axis=1)], axis=1,
+            )
+
         # Compare mu_file1 against all the MUs in file2
         for mu_file2 in range(emgfile2["NUMBER_OF_MUS"]):
-            # Firs, align the STAs
+            df1 = unpacked_sta1[mu_file1]
+            df2 = unpacked_sta2[mu_file2]
+
+            # Firs, align the STAs (custom MUAPs are not aligned). Same as
+            # align_by_xcorr, without packing and unpacking the STAs.
             if not isinstance(custom_muaps, list):
-                aligned_sta1, aligned_sta2 = align_by_xcorr(
-                    sta_emgfile1[mu_file1],
-                    sta_emgfile2[mu_file2],
-                    finalduration=0.5
+                rows1, rows2 = _xcorr_alignment(
+                    df1, df2, finalduration=0.5, lag=lags[mu_file2],
                 )
             else:
-                aligned_sta1 = sta_emgfile1[mu_file1]
-                aligned_sta2 = sta_emgfile2[mu_file2]
-
-            # Second, compute 2d cross-correlation
-            df1, _ = unpack_sta(aligned_sta1)
-            df1.dropna(axis=1, inplace=True)
-            df2, _ = unpack_sta(aligned_sta2)
-            df2.dropna(axis=1, inplace=True)
-            _, normxcorr_max = norm_twod_xcorr(
-                df1, df2, mode="full"
+                rows1, rows2 = slice(None), slice(None)
+            df1, df2 = df1[rows1], df2[rows2]
+
+            # Second, compute 2d cross-correlation. Same as
+            # norm_twod_xcorr(df1, df2, mode="full"), but only the maximum is
+            # calculated and the energies of the STAs are not recomputed.
+            start1, stop1, _ = rows1.indices(len(cum_energy1[mu_file1]) - 1)
+            start2, stop2, _ = rows2.indices(len(cum_energy2[mu_file2]) - 1)
+            energy1 = (
+                cum_energy1[mu_file1][stop1] - cum_energy1[mu_file1][start1]
             )
+            energy2 = (
+                cum_energy2[mu_file2][stop2] - cum_energy2[mu_file2][start2]
+            )
+            normxcorr_max = signal.correlate(
+                df1, df2, mode="full", method="fft",
+            ).max() / np.sqrt(energy1 * energy2)
 
             # Third, fill the tracking_res
             if exclude_belowthreshold is False:
@@ -1077,9 +1299,13 @@ def tracking(
         return res
 
     if multiprocessing:
-        # Start parallel execution
-        res = Parallel(n_jobs=-1, verbose=1)(
-            delayed(parallel)(mu_file1) for mu_file1 in range(emgfile1["NUMBER_OF_MUS"])
+        # Start parallel execution. The work of each MU is done by scipy FFTs
+        # and NumPy, which release the GIL. Threads share the precomputed
+        # STAs and spectra, instead of pickling them for every task as
+        # separate processes would.
+        res = Parallel(n_jobs=-1, prefer="threads", verbose=1)(
+            delayed(parallel)(mu_file1)
+            for mu_file1 in range(emgfile1["NUMBER_OF_MUS"])
         )
         print("\n")
 
@@ -1098,43 +1324,34 @@ def tracking(
             )
         print("\n")
 
-    # Convert res to pd.DataFrame
-    for pos, i in enumerate(res):
-        if pos == 0:
-            tracking_res = pd.DataFrame(i)
-        else:
-            tracking_res = pd.concat([tracking_res, pd.DataFrame(i)])
-    tracking_res.reset_index(drop=True, inplace=True)
+    # Convert res to pd.DataFrame, joining the results of all the MUs of
+    # file 1 at once. The dtypes are set here, so that they are correct also
+    # when no pairs have been detected.
+    dtypes = {"MU_file1": int, "MU_file2": int, "XCC": float}
+    tracking_res = pd.DataFrame(
+        {
+            key: np.array(
+                [value for this_res in res for value in this_res[key]],
+                dtype=dtype,
+            )
+            for key, dtype in dtypes.items()
+        }
+    )
 
     # Filter the results
     if filter:
-        # Sort file by MUs in file 1 and XCC to have first the highest XCC
-        tracking_res = tracking_res.sort_values(
-            by=["MU_file1", "XCC"], ascending=False,
-        )
-
-        # Get unique MUs from file 1
-        unique = tracking_res["MU_file1"].unique()
-
-        res_unique = pd.DataFrame(columns=tracking_res.columns)
-
-        # Get the combo uf unique MUs from file 1 with MUs from file 2
-        for pos, mu1 in enumerate(unique):
-            this_res = tracking_res[tracking_res["MU_file1"] == mu1]
-            # Fill the result df with the first row (highest XCC)
-            res_unique.loc[pos, :] = this_res.iloc[0, :]
+        # Get the combo of unique MUs from file 1 with the MUs from file 2
+        # with the highest XCC.
+        tracking_res = tracking_res.loc[
+            tracking_res.groupby("MU_file1")["XCC"].idxmax()
+        ]
 
         # Now repeat the task with MUs from file 2
-        tracking_res = res_unique.sort_values(
-            by=["MU_file2", "XCC"], ascending=False
-        )
-        unique = tracking_res["MU_file2"].unique()
-        res_unique = pd.DataFrame(columns=tracking_res.columns)
-        for pos, mu2 in enumerate(unique):
-            this_res = tracking_res[tracking_res["MU_file2"] == mu2]
-            res_unique.loc[pos, :] = this_res.iloc[0, :]
+        tracking_res = tracking_res.loc[
+            tracking_res.groupby("MU_file2")["XCC"].idxmax()
+        ]
 
-        tracking_res = res_unique.sort_values(by=["MU_file1"])
+        tracking_res = tracking_res.sort_values(by=["MU_file1"])
 
     else:
         # Sort file by MUs in file 1 and XCC to have first the highest XCC
@@ -1143,13 +1360,10 @@ def tracking(
         )
 
     # Print the full results
-    pd.set_option("display.max_rows", None)
-    convert_dict = {"MU_file1": int, "MU_file2": int, "XCC": float}
-    tracking_res = tracking_res.astype(convert_dict)
     tracking_res.reset_index(drop=True, inplace=True)
     text = "Filtered tracking results:\n\n" if filter else "Total tracking results:\n\n"
-    print(text, tracking_res, "\n")
-    pd.reset_option("display.max_rows")
+    with pd.option_context("display.max_rows", None):
+        print(text, tracking_res, "\n")
 
     # Plot the MUs pairs
     if show:
@@ -1177,10 +1391,9 @@ def tracking(
                     showimmediately=False
                 )
 
-            if ind == tracking_res.index[-1]:
-                plt.show(block=True)
-            else:
-                plt.show(block=False)
+        # Show all the figures at once, instead of refreshing the GUI
+        # backend after every pair.
+        plt.show(block=True)
 
     # Call the GUI and return the tracking_res
     if gui:
@@ -1833,9 +2046,9 @@ def remove_duplicates_between(
     >>> emg.asksavefile(emgfile2)
     """
 
-    # Work on deepcopies
-    emgfile1 = copy.deepcopy(emgfile1)
-    emgfile2 = copy.deepcopy(emgfile2)
+    # tracking and delete_mus do not modify their inputs, and delete_mus
+    # returns a deep copy. Only the emgfile that is not passed to delete_mus
+    # needs to be copied before returning it.
 
     # Get tracking results to identify duplicated MUs
     tracking_res = tracking(
@@ -1877,6 +2090,7 @@ def remove_duplicates_between(
             emgfile1 = delete_mus(
                 emgfile=emgfile1, munumber=mus_to_remove, if_single_mu="remove"
             )
+            emgfile2 = copy.deepcopy(emgfile2)
 
             return emgfile1, emgfile2, tracking_res
 
@@ -1887,6 +2101,7 @@ def remove_duplicates_between(
             emgfile2 = delete_mus(
                 emgfile=emgfile2, munumber=mus_to_remove, if_single_mu="remove"
             )
+            emgfile1 = copy.deepcopy(emgfile1)
 
             return emgfile1, emgfile2, tracking_res
 
@@ -1965,30 +2180,32 @@ def xcc_sta(sta):
     >>> xcc_sta = emg.xcc_sta(sta)
     """
 
-    # Obtain the structure of the sta_xcc dict
-    xcc_sta = copy.deepcopy(sta)
+    # Obtain the structure of the sta_xcc dict. The XCC is stored in new
+    # pd.DataFrames, so there is no need to copy the STA.
+    xcc_sta = {mu_number: {} for mu_number in sta}
 
     # Access all the MUs and matrix columns
     for mu_number in sta:
         for matrix_col in sta[mu_number].keys():
             df = sta[mu_number][matrix_col]
-
-            # Reverse matrix columns to start pairs comparison from the last
-            reversed_col = list(df.columns)
-            reversed_col.reverse()
-
-            for pos, col in enumerate(reversed_col):
-                if pos != len(reversed_col)-1:
-                    # Use np.ndarrays for performance
-                    this_c = df.loc[:, reversed_col[pos]].to_numpy()
-                    next_c = df.loc[:, reversed_col[pos+1]].to_numpy()
-                    xcc = norm_xcorr(sig1=this_c, sig2=next_c, out="max")
-                else:
-                    xcc = np.nan
-
-                xcc_sta[mu_number][matrix_col][col] = xcc
-
-            xcc_sta[mu_number][matrix_col] = xcc_sta[mu_number][matrix_col].drop_duplicates()
+            values = df.to_numpy()
+
+            # Calculate the XCC of every channel with the previous one at
+            # once, as in norm_xcorr(out="max"). The channels are normalised
+            # by their norm and cross-correlated in the frequency domain,
+            # zero-padding them to exactly the lags of the full xcorr (longer
+            # padding would add lags with no overlap and xcc = 0).
+            values = values / np.linalg.norm(values, axis=0)
+            n_fft = 2 * len(values) - 1
+            spectra = fft.rfft(values, n=n_fft, axis=0)
+            xcc = fft.irfft(
+                spectra[:, 1:] * np.conj(spectra[:, :-1]), n=n_fft, axis=0,
+            ).max(axis=0)
+
+            # The first channel has no previous channel to compare with
+            xcc_sta[mu_number][matrix_col] = pd.DataFrame(
+                [np.concatenate(([np.nan], xcc))], columns=df.columns,
+            )
 
     return xcc_sta
 
@@ -2005,9 +2222,9 @@ def estimate_cv_via_mle(emgfile, signal):
     emgfile : dict
         The dictionary containing the emgfile from whic "signal" has been
         extracted. This is used to know IED and FSAMP.
-    signal : pd.DataFrame
-        A dataframe containing the signals on which to estimate CV. The signals
-        should be organised in colums.
+    signal : pd.DataFrame or np.ndarray
+        A dataframe (or array) containing the signals on which to estimate CV.
+        The signals should be organised in colums.
 
     Returns
     -------
@@ -2053,7 +2270,7 @@ def estimate_cv_via_mle(emgfile, signal):
     fsamp = emgfile["FSAMP"]
 
     # Work with numpy vectorised operations for better performance
-    sig = signal.to_numpy()
+    sig = np.asarray(signal)
     sig = sig.T
 
     # Prepare the input 1D signals for find_mle_teta
@@ -2159,6 +2376,33 @@ class MUcv_gui():
             timewindow=muaps_timewindow,
         )
         self.sta_xcc = xcc_sta(self.st)
+        # Keep the arrays of each MU and column, so that every estimate only
+        # needs to slice the selected rows. Fortran order keeps each row
+        # (channel) contiguous.
+        self.st_np = {
+            mu: {
+                col: df.to_numpy(dtype=np.float32).copy(order="F")
+                for col, df in self.st[mu].items()
+            }
+            for mu in self.st
+        }
+        # The RMS of each channel does not depend on the selected rows,
+        # calculate it once summing the squares in a single pass.
+        self.channels_rms = {
+            mu: {
+                col: np.sqrt(np.einsum("ij,ij->j", arr, arr) / arr.shape[0])
+                for col, arr in self.st_np[mu].items()
+            }
+            for mu in self.st_np
+        }
+        self.sta_xcc_np = {
+            mu: {
+                col: df.to_numpy(dtype=np.float64)
+                for col, df in self.sta_xcc[mu].items()
+            }
+            for mu in self.sta_xcc
+        }
+        self.cv_cache = {}
         self.figsize = figsize
         self.csv_separator = csv_separator
 
@@ -2242,7 +2486,7 @@ class MUcv_gui():
         self.col_cb.current(0)
 
         # Label and combobox to select the matrix channels
-        self.rows = list(range(len(list(self.st[0][self.columns[0]].columns))))
+        self.rows = list(range(self.st[0][self.columns[0]].shape[1]))
 
         start_label = ttk.Label(top_left_frm, text="From row", width=15)
         start_label.grid(row=0, column=3, columnspan=1, sticky=tk.W)
@@ -2302,32 +2546,27 @@ class MUcv_gui():
         copy_btn.pack(side=tk.TOP, fill="x", pady=(0, 5))
 
         # Add text frame to show the results (only CV and RMS)
+        # Create each column with its final dtype
+        n_mus = len(self.all_mus)
         self.res_df = pd.DataFrame(
-            data=0.00,
+            {
+                "CV": np.zeros(n_mus, dtype="float64"),
+                "RMS": np.zeros(n_mus, dtype="float64"),
+                "XCC": np.zeros(n_mus, dtype="float64"),
+                "Column": pd.array(["0.0"] * n_mus, dtype="string"),
+                "From_Row": np.zeros(n_mus, dtype="int64"),
+                "To_Row": np.zeros(n_mus, dtype="int64"),
+            },
             index=self.all_mus,
-            columns=["CV", "RMS", "XCC", "Column", "From_Row", "To_Row"],
         )
-        # Set the dtypes for each column
-        self.res_df = self.res_df.astype({
-            "CV": "float64",
-            "RMS": "float64",
-            "XCC": "float64",
-            "Column": "string",
-            "From_Row": "int64",
-            "To_Row": "int64",
-        })
         # Set values
         self.textbox = tk.Text(right_frm, width=25)
         self.textbox.pack(side=tk.TOP, expand=True, fill="y")
-        self.textbox.insert(
-            '1.0',
-            self.res_df.loc[:, ["CV", "RMS", "XCC"]].to_string(
-                float_format="{:.2f}".format
-            ),
-        )
+        self.textbox.insert('1.0', self.res_to_text())
 
         # Plot MU 0 while opening the GUI,
         # this will move the GUI in the background ??.
+        self.canvases = {}
         self.gui_plot()
 
         # Bring back the GUI in the foreground
@@ -2346,25 +2585,39 @@ class MUcv_gui():
         # Get MU number
         mu = int(self.selectmu_cb.get())
 
-        # Get the figure
-        fig = plot_muaps_for_cv(
-            sta_dict=self.st[mu],
-            xcc_sta_dict=self.sta_xcc[mu],
-            showimmediately=False,
-            figsize=self.figsize,
-        )
-
-        # If canvas already exists, destroy it
+        # If a canvas is already shown, hide it. It is kept in
+        # self.canvases and shown again if its MU is selected.
         if hasattr(self, 'canvas'):
-            self.canvas.get_tk_widget().destroy()
+            self.canvas.get_tk_widget().pack_forget()
+
+        if mu in self.canvases:
+            self.canvas = self.canvases[mu]
+        else:
+            # Get the figure
+            fig = plot_muaps_for_cv(
+                sta_dict=self.st[mu],
+                xcc_sta_dict=self.sta_xcc[mu],
+                showimmediately=False,
+                figsize=self.figsize,
+            )
+
+            # Place the figure in the GUI
+            self.canvas = FigureCanvasTkAgg(fig, master=self.bottom_left_frm)
+            self.canvas.draw_idle()  # Await resizing
+            self.canvases[mu] = self.canvas
+            plt.close(fig)
 
-        # Place the figure in the GUI
-        self.canvas = FigureCanvasTkAgg(fig, master=self.bottom_left_frm)
-        self.canvas.draw_idle()  # Await resizing
         self.canvas.get_tk_widget().pack(
             expand=True, fill="both", padx=0, pady=0,
         )
-        plt.close()
+
+    def res_to_text(self):
+        # Format the results shown in the textbox (only CV, RMS and XCC).
+        # to_string() is kept over repr() so that no MU is truncated.
+
+        return self.res_df[["CV", "RMS", "XCC"]].to_string(
+            float_format="{:.2f}".format
+        )
 
     def copy_to_clipboard(self):
         # Copy the dataframe to clipboard in csv format.
@@ -2375,43 +2628,47 @@ class MUcv_gui():
     def compute_cv(self):
         # Compute conduction velocity.
 
-        # Get the muaps of the selected columns.
-        sig = self.st[int(self.selectmu_cb.get())][self.col_cb.get()]
-        col_list = list(range(int(self.start_cb.get()), int(self.stop_cb.get())+1))
-
-        sig = sig.iloc[:, col_list]
-
-        # Verify that the signal is correcly oriented
-        if len(sig) < len(sig.columns):
-            raise ValueError(
-                "The number of signals exceeds the number of samples. Verify that each row represents a signal"
-            )
+        mu = int(self.selectmu_cb.get())
+        col = self.col_cb.get()
+        start = int(self.start_cb.get())
+        stop = int(self.stop_cb.get())
+
+        # The results only depend on the selection, estimate them once
+        key = (mu, col, start, stop)
+        if key not in self.cv_cache:
+            # Get the muaps of the selected columns
+            sig = self.st_np[mu][col][:, start:stop+1]
+
+            # Verify that the signal is correcly oriented
+            if sig.shape[0] < sig.shape[1]:
+                raise ValueError(
+                    "The number of signals exceeds the number of samples. " +
+                    "Verify that each row represents a signal"
+                )
 
-        # Estimate CV
-        cv = estimate_cv_via_mle(emgfile=self.emgfile, signal=sig)
+            # Estimate CV
+            cv = estimate_cv_via_mle(emgfile=self.emgfile, signal=sig)
 
-        # Calculate RMS
-        sig = sig.to_numpy()
-        rms = np.mean(np.sqrt((np.mean(sig**2, axis=0))))
+            # Average the RMS of the selected channels
+            rms = self.channels_rms[mu][col][start:stop+1].mean()
 
-        # Update the self.res_df and the self.textbox
-        mu = int(self.selectmu_cb.get())
+            # Average the XCC of the selected channels (the first has no XCC)
+            xcc = np.nanmean(self.sta_xcc_np[mu][col][:, start+1:stop+1])
 
-        self.res_df.loc[mu, "CV"] = cv
-        self.res_df.loc[mu, "RMS"] = rms
+            self.cv_cache[key] = (cv, rms, xcc)
 
-        xcc_col_list = list(range(int(self.start_cb.get())+1, int(self.stop_cb.get())+1))
-        xcc = self.sta_xcc[mu][self.col_cb.get()].iloc[:, xcc_col_list].mean().mean()
-        self.res_df.loc[mu, "XCC"] = xcc
+        cv, rms, xcc = self.cv_cache[key]
 
-        self.res_df.loc[mu, "Column"] = str(self.col_cb.get())
-        self.res_df.loc[mu, "From_Row"] = int(self.start_cb.get())
-        self.res_df.loc[mu, "To_Row"] = int(self.stop_cb.get())
+        # Write the whole row at once
+        self.res_df.loc[
+            mu, ["CV", "RMS", "XCC", "Column", "From_Row", "To_Row"]
+        ] = [
+            cv,
+            rms,
+            xcc,
+            str(col),
+            start,
+            stop,
+        ]
 
-        self.textbox.replace(
-            '1.0',
-            'end',
-            self.res_df.loc[:, ["CV", "RMS", "XCC"]].to_string(
-                float_format="{:.2f}".format
-            ),
-        )
+        self.textbox.replace('1.0', 'end', self.res_to_text())
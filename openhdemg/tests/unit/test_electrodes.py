@@ -121,6 +121,140 @@ class TestElectrodes(unittest.TestCase):
             else:
                 self.assertIsInstance(res, pd.DataFrame)
 
+    def test_sort_rawemg_ragged_custom_order(self):
+        """
+        Test custom sorting orders with columns of different lengths.
+        """
+
+        emgfile = emg_from_samplefile()
+        raw = emgfile["RAW_SIGNAL"]
+        custom_sorting_order = [[3, 2, 1, 0], [np.nan, 4], [5, 6, 7]]
+
+        res = sort_rawemg(
+            emgfile,
+            code="Custom order",
+            dividebycolumn=False,
+            custom_sorting_order=custom_sorting_order,
+        )
+        self.assertEqual(res.shape, (raw.shape[0], 9))
+        self.assertTrue(res[4].isna().all())
+        for pos, ch in enumerate([3, 2, 1, 0, None, 4, 5, 6, 7]):
+            if ch is not None:
+                self.assertTrue(
+                    np.array_equal(res[pos].to_numpy(), raw[ch].to_numpy())
+                )
+
+        # A ragged order cannot be divided by column
+        with self.assertRaises(ValueError):
+            sort_rawemg(
+                emgfile,
+                code="Custom order",
+                dividebycolumn=True,
+                custom_sorting_order=custom_sorting_order,
+            )
+
+    def test_sort_rawemg_channels(self):
+        """
+        Test that the built-in sorting orders use every channel once.
+        """
+
+        emgfile = emg_from_samplefile()
+
+        for code in ["GR08MM1305", "GR04MM1305", "GR10MM0808"]:
+            for orientation in [0, 180]:
+                res = sort_rawemg(
+                    emgfile,
+                    code=code,
+                    orientation=orientation,
+                    dividebycolumn=False,
+                )
+                res_ndarray = sort_rawemg(
+                    emgfile,
+                    code=code,
+                    orientation=orientation,
+                    dividebycolumn=False,
+                    return_ndarray=True,
+                )
+                self.assertIsInstance(res_ndarray, np.ndarray)
+                self.assertTrue(
+                    np.array_equal(res.to_numpy(), res_ndarray, equal_nan=True)
+                )
+
+                raw = emgfile["RAW_SIGNAL"].to_numpy()
+                res = res.dropna(axis=1, how="all").to_numpy()
+                self.assertEqual(res.shape, raw.shape)
+
+                # Every channel of RAW_SIGNAL is in the sorted_rawemg
+                for ch in range(raw.shape[1]):
+                    self.assertTrue(
+                        np.any(np.all(res == raw[:, [ch]], axis=0))
+                    )
+
+    def test_sort_rawemg_independent_results(self):
+        """
+        Test that repeated calls to sort_rawemg return independent results.
+        """
+
+        emgfile = emg_from_samplefile()
+
+        res1 = sort_rawemg(emgfile, code="GR08MM1305", orientation=180)
+        res1["col1"].columns = range(13)  # Must not affect later calls
+        res2 = sort_rawemg(emgfile, code="GR08MM1305", orientation=180)
+        self.assertIsNot(res1, res2)
+        self.assertEqual(list(res2["col1"].columns), list(range(13, 26)))
+        pd.testing.assert_frame_equal(res1["col0"], res2["col0"])
+
+        # Editing a result in place must not affect later calls
+        res2["col0"].to_numpy(copy=False)[:] = 0
+        self.assertTrue((res2["col0"] == 0).all().all())
+        res3 = sort_rawemg(emgfile, code="GR08MM1305", orientation=180)
+        pd.testing.assert_frame_equal(res3["col0"], res1["col0"])
+
+        arr1 = sort_rawemg(
+            emgfile, code="GR08MM1305", orientation=180, return_ndarray=True,
+        )
+        arr1["col2"][:] = 0
+        arr2 = sort_rawemg(
+            emgfile, code="GR08MM1305", orientation=180, return_ndarray=True,
+        )
+        self.assertTrue(
+            np.array_equal(arr2["col2"], res1["col2"].to_numpy())
+        )
+
+        # Editing the RAW_SIGNAL in place is reflected in a new sorting
+        emgfile["RAW_SIGNAL"].iloc[:, 0] = 0
+        self.assertTrue((emgfile["RAW_SIGNAL"].iloc[:, 0] == 0).all())
+        res4 = sort_rawemg(emgfile, code="GR08MM1305", orientation=180)
+        n_zeroed = sum(
+            int((res4[col] == 0).all(axis=0).sum()) for col in res4
+        )
+        self.assertEqual(n_zeroed, 1)
+
+        # Without sorting, the results are copies of the RAW_SIGNAL
+        for dividebycolumn in [True, False]:
+            for return_ndarray in [True, False]:
+                res = sort_rawemg(
+                    emgfile,
+                    code="None",
+                    dividebycolumn=dividebycolumn,
+                    n_rows=8,
+                    n_cols=8,
+                    return_ndarray=return_ndarray,
+                )
+                sigs = res.values() if dividebycolumn else [res]
+                for sig in sigs:
+                    self.assertFalse(
+                        np.shares_memory(
+                            np.asarray(sig),
+                            emgfile["RAW_SIGNAL"].to_numpy(),
+                        )
+                    )
+
+        # A new RAW_SIGNAL is sorted again
+        emgfile["RAW_SIGNAL"] = emgfile["RAW_SIGNAL"] * 2
+        res5 = sort_rawemg(emgfile, code="GR08MM1305", orientation=180)
+        pd.testing.assert_frame_equal(res5["col1"], res3["col1"] * 2)
+
 
 if __name__ == '__main__':
     unittest.main()